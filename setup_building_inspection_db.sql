@@ -39,11 +39,12 @@ CREATE OR REPLACE TABLE stage_file_data (
 );
 
 -- Create table for storing file chunks (binary data split into manageable pieces)
+-- chunk_data is BINARY: hex VARCHAR doubled storage and forced a client-side decode
 CREATE OR REPLACE TABLE stage_file_chunks (
     chunk_id STRING PRIMARY KEY,
     file_id STRING NOT NULL,
     chunk_index NUMBER NOT NULL,
-    chunk_data VARCHAR(16000000),
+    chunk_data BINARY(8388608),
     chunk_size NUMBER NOT NULL,
     upload_time TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
     FOREIGN KEY (file_id) REFERENCES stage_file_data(file_id)